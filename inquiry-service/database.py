@@ -5,6 +5,9 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
+from slow_query import recorder as slow_query_recorder
+from metrics import metrics, TimedQueuePool
+
 # Database URL - SQLite for local, PostgreSQL for production
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
@@ -15,10 +18,17 @@ DATABASE_URL = os.getenv(
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(
         DATABASE_URL,
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False},
+        poolclass=TimedQueuePool
     )
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool)
+
+# Pool wait time and checked-out connections feed the autoscaling metrics
+metrics.watch_pool(engine.pool)
+
+# Opt-in slow-query capture (SLOW_QUERY_THRESHOLD_MS)
+slow_query_recorder.attach(engine)
 
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -5,18 +5,22 @@ APIs:
 - Create new inquiry
 - Retrieve all inquiries
 - Health check
+- Slow-query log (admin)
 """
 from fastapi import FastAPI, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
 import logging
 
-from database import engine, get_db, Base
+from database import engine, get_db, slow_query_recorder
 from models import Inquiry
 from schemas import InquiryCreate, InquiryResponse
+from maintenance import ensure_schema
+from request_logging import configure_logging, install_request_logging
+from metrics import install_metrics
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure structured, sampled logging
+configure_logging("inquiry-service")
 logger = logging.getLogger(__name__)
 
 # Create FastAPI app
@@ -25,10 +29,18 @@ app = FastAPI(
     description="Microservice for managing customer inquiries",
     version="1.0.0"
 )
+install_request_logging(app)
+install_metrics(app)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-logger.info("Database tables created successfully")
+@app.on_event("startup")
+def migrate_schema():
+    """
+    Create and upgrade tables (partitioned by month on PostgreSQL)
+
+    Runs when the server starts, not when the module is imported.
+    """
+    ensure_schema(engine)
+    logger.info("Database tables created successfully")
 
 
 @app.get("/health", tags=["Health"])
@@ -67,11 +79,11 @@ def create_inquiry(
         db.add(new_inquiry)
         db.commit()
         db.refresh(new_inquiry)
-        logger.info(f"Created inquiry #{new_inquiry.id} for plot {new_inquiry.plot_id}")
+        logger.info("Created inquiry #%s for plot %s", new_inquiry.id, new_inquiry.plot_id)
         return new_inquiry
     except Exception as e:
         db.rollback()
-        logger.error(f"Error creating inquiry: {str(e)}")
+        logger.error("Error creating inquiry: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create inquiry"
@@ -90,7 +102,7 @@ def get_all_inquiries(
     db: Session = Depends(get_db)
 ):
     """
-    Retrieve all inquiries with optional filtering
+    Retrieve inquiries, most recent first, with optional filtering
     
     Args:
         skip: Number of records to skip (default: 0)
@@ -108,17 +120,42 @@ def get_all_inquiries(
         if plot_id:
             query = query.filter(Inquiry.plot_id == plot_id)
         
+        # Matches the (plot_id, created_at DESC) index
+        query = query.order_by(Inquiry.created_at.desc())
+
         inquiries = query.offset(skip).limit(limit).all()
-        logger.info(f"Retrieved {len(inquiries)} inquiries")
+        logger.info("Retrieved %d inquiries", len(inquiries))
         return inquiries
     except Exception as e:
-        logger.error(f"Error retrieving inquiries: {str(e)}")
+        logger.error("Error retrieving inquiries: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to retrieve inquiries"
         )
 
 
+@app.get("/admin/slow-queries", tags=["Admin"])
+def get_slow_queries():
+    """
+    Recorded slow SQL statements, newest first
+
+    Each entry has the statement, its duration, the types of its bound
+    parameters and an EXPLAIN plan. Enable with SLOW_QUERY_THRESHOLD_MS.
+    """
+    return {
+        "enabled": slow_query_recorder.enabled,
+        "threshold_ms": slow_query_recorder.threshold_ms,
+        "capacity": slow_query_recorder.capacity,
+        "queries": slow_query_recorder.entries(),
+    }
+
+
+@app.delete("/admin/slow-queries", status_code=status.HTTP_204_NO_CONTENT, tags=["Admin"])
+def clear_slow_queries():
+    """Empty the slow-query buffer"""
+    slow_query_recorder.clear()
+
+
 @app.get("/", tags=["Root"])
 def root():
     """Root endpoint with service information"""
@@ -127,8 +164,10 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "metrics": "/metrics",
             "create_inquiry": "POST /inquiries",
             "get_inquiries": "GET /inquiries",
+            "slow_queries": "GET /admin/slow-queries",
             "docs": "/docs"
         }
     }
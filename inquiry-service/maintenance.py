@@ -0,0 +1,422 @@
+"""
+Maintenance tasks for the inquiries table
+
+On PostgreSQL the inquiries table is declaratively partitioned by month
+on created_at. This module creates the partitioned table, keeps upcoming
+monthly partitions in place, and applies the retention policy: months
+older than the retention window are written to a gzip-compressed JSON
+lines archive and then dropped from the database.
+
+On SQLite (local development) there are no partitions; retention works
+the same way month by month using range deletes.
+
+Usage:
+    python maintenance.py migrate
+    python maintenance.py partitions --ahead 3
+    python maintenance.py archive --retention-months 12 --archive-dir ./archive
+    python maintenance.py run
+"""
+from datetime import datetime, timezone
+import argparse
+import gzip
+import json
+import logging
+import os
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine import Engine
+
+from database import engine as default_engine, Base, SessionLocal
+from models import Inquiry
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = Inquiry.__tablename__
+DEFAULT_PARTITION = f"{TABLE_NAME}_default"
+
+RETENTION_MONTHS = int(os.getenv("INQUIRY_RETENTION_MONTHS", "12"))
+ARCHIVE_DIR = os.getenv("INQUIRY_ARCHIVE_DIR", "./archive")
+PARTITIONS_AHEAD = int(os.getenv("INQUIRY_PARTITIONS_AHEAD", "3"))
+
+# pg_advisory_xact_lock key serialising schema changes across replicas
+SCHEMA_LOCK_KEY = 0x696E7175  # "inqu"
+
+# Mirrors models.Inquiry. PostgreSQL requires the partition key to be part
+# of the primary key, hence (id, created_at).
+PARTITIONED_TABLE_DDL = f"""
+CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+    id SERIAL NOT NULL,
+    plot_id VARCHAR NOT NULL,
+    name VARCHAR NOT NULL,
+    email VARCHAR NOT NULL,
+    phone VARCHAR NOT NULL,
+    message VARCHAR NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at)
+"""
+
+COMPOSITE_INDEX_DDL = f"""
+CREATE INDEX IF NOT EXISTS ix_{TABLE_NAME}_plot_id_created_at
+    ON {TABLE_NAME} (plot_id, created_at DESC)
+"""
+
+
+def month_start(value: datetime) -> datetime:
+    """Truncate a datetime to the first instant of its month (UTC)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    """Shift a month-start datetime by a number of months"""
+    index = value.year * 12 + (value.month - 1) + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(start: datetime) -> str:
+    """Name of the monthly partition starting at `start`"""
+    return f"{TABLE_NAME}_p{start:%Y_%m}"
+
+
+def is_postgres(engine: Engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def _is_partitioned(conn) -> bool:
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"),
+        {"name": TABLE_NAME}
+    ).scalar()
+    return relkind == "p"
+
+
+def _lock_schema(conn):
+    """Hold the schema lock until the current transaction ends (PostgreSQL only)"""
+    if is_postgres(conn):
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+
+
+def _exists(conn, name: str) -> bool:
+    return conn.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}
+    ).scalar()
+
+
+def create_partition(conn, start: datetime):
+    """
+    Create the monthly partition starting at `start` if it does not exist
+
+    PostgreSQL refuses to create a partition whose range already has rows in
+    the default partition (e.g. after the maintenance job missed more than
+    PARTITIONS_AHEAD months). In that case the default partition is
+    detached, the new partition created, the matching rows moved into it
+    and the default partition re-attached, all in the caller's transaction.
+    """
+    name = partition_name(start)
+    if _exists(conn, name):
+        return
+    end = add_months(start, 1)
+    create = (
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE_NAME} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+    in_range = "created_at >= :start AND created_at < :end"
+    bounds = {"start": start, "end": end}
+    stray = _exists(conn, DEFAULT_PARTITION) and conn.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})"), bounds
+    ).scalar()
+    if not stray:
+        conn.execute(text(create))
+        return
+
+    logger.warning("Moving rows for %s out of %s", name, DEFAULT_PARTITION)
+    columns = "id, plot_id, name, email, phone, message, created_at"
+    conn.execute(text(f"ALTER TABLE {TABLE_NAME} DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(create))
+    conn.execute(text(
+        f"INSERT INTO {TABLE_NAME} ({columns}) "
+        f"SELECT {columns} FROM {DEFAULT_PARTITION} WHERE {in_range}"
+    ), bounds)
+    conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"), bounds)
+    conn.execute(text(f"ALTER TABLE {TABLE_NAME} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+
+def ensure_partitioned_table(engine: Engine = default_engine):
+    """
+    Create the partitioned inquiries table on PostgreSQL
+
+    Must run before Base.metadata.create_all(), which then finds the table
+    already present and leaves it alone. A no-op on other backends and when
+    a table (partitioned or legacy) already exists; use `migrate` to convert
+    a legacy table. The check and create run under the schema lock, so
+    replicas starting together do not race on CREATE TABLE.
+    """
+    if not is_postgres(engine):
+        return
+    with engine.begin() as conn:
+        _lock_schema(conn)
+        if _exists(conn, TABLE_NAME):
+            return
+        conn.execute(text(PARTITIONED_TABLE_DDL))
+        conn.execute(text(COMPOSITE_INDEX_DDL))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} "
+            f"PARTITION OF {TABLE_NAME} DEFAULT"
+        ))
+        current = month_start(datetime.now(timezone.utc))
+        for offset in range(PARTITIONS_AHEAD + 1):
+            create_partition(conn, add_months(current, offset))
+    logger.info("Created partitioned table %s", TABLE_NAME)
+
+
+def ensure_indexes(engine: Engine = default_engine):
+    """
+    Bring the indexes of an existing inquiries table up to date
+
+    create_all() leaves existing tables alone, so databases created before
+    the composite index still have the single-column plot_id index. Adds
+    (plot_id, created_at DESC) and drops the index it replaces.
+    """
+    with engine.begin() as conn:
+        _lock_schema(conn)
+        conn.execute(text(COMPOSITE_INDEX_DDL))
+        conn.execute(text(f"DROP INDEX IF EXISTS ix_{TABLE_NAME}_plot_id"))
+
+
+def ensure_schema(engine: Engine = default_engine):
+    """
+    Create and upgrade the inquiries table when the service starts
+
+    Every step holds the schema lock on PostgreSQL, so it is safe for
+    several replicas to run this at the same time.
+    """
+    ensure_partitioned_table(engine)
+    with engine.begin() as conn:
+        _lock_schema(conn)
+        Base.metadata.create_all(bind=conn)
+    ensure_indexes(engine)
+
+
+def ensure_partitions(engine: Engine = default_engine, ahead: int = PARTITIONS_AHEAD) -> int:
+    """
+    Make sure partitions exist for the current month and `ahead` months after it
+
+    Returns the number of partitions in place. A no-op on non-PostgreSQL
+    backends and on a legacy unpartitioned table (see migrate_legacy_table).
+    """
+    if not is_postgres(engine):
+        return 0
+    current = month_start(datetime.now(timezone.utc))
+    with engine.begin() as conn:
+        _lock_schema(conn)
+        if not _is_partitioned(conn):
+            logger.warning(
+                "%s is not partitioned; skipping partition creation "
+                "(run `python maintenance.py migrate` to convert it)", TABLE_NAME
+            )
+            return 0
+        ensured = 0
+        for offset in range(ahead + 1):
+            start = add_months(current, offset)
+            # One savepoint per month: a failure must not stop the others,
+            # nor the retention step that runs after this
+            try:
+                with conn.begin_nested():
+                    create_partition(conn, start)
+                ensured += 1
+            except SQLAlchemyError:
+                logger.exception("Could not create partition %s", partition_name(start))
+    logger.info("Ensured %d of %d monthly partitions from %s", ensured, ahead + 1, partition_name(current))
+    return ensured
+
+
+def migrate_legacy_table(engine: Engine = default_engine) -> bool:
+    """
+    Convert an existing unpartitioned inquiries table into the partitioned layout
+
+    Runs in a single transaction: the old table is renamed, the partitioned
+    table and a partition for every month with data are created, rows are
+    copied across and the id sequence is advanced past the copied ids.
+
+    Returns True if a migration was performed.
+    """
+    if not is_postgres(engine):
+        return False
+    legacy = f"{TABLE_NAME}_legacy"
+    with engine.begin() as conn:
+        if not _exists(conn, TABLE_NAME) or _is_partitioned(conn):
+            return False
+
+        conn.execute(text(f"ALTER TABLE {TABLE_NAME} RENAME TO {legacy}"))
+        conn.execute(text(f"ALTER INDEX IF EXISTS {TABLE_NAME}_pkey RENAME TO {legacy}_pkey"))
+        for index in ("ix_inquiries_id", "ix_inquiries_plot_id"):
+            conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+        conn.execute(text(PARTITIONED_TABLE_DDL))
+        conn.execute(text(COMPOSITE_INDEX_DDL))
+        conn.execute(text(
+            f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE_NAME} DEFAULT"
+        ))
+
+        oldest = conn.execute(text(f"SELECT min(created_at) FROM {legacy}")).scalar()
+        current = month_start(datetime.now(timezone.utc))
+        start = month_start(oldest) if oldest else current
+        while start <= add_months(current, PARTITIONS_AHEAD):
+            create_partition(conn, start)
+            start = add_months(start, 1)
+
+        conn.execute(text(
+            f"INSERT INTO {TABLE_NAME} (id, plot_id, name, email, phone, message, created_at) "
+            f"SELECT id, plot_id, name, email, phone, message, coalesce(created_at, now()) "
+            f"FROM {legacy}"
+        ))
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE_NAME}', 'id'), "
+            f"coalesce((SELECT max(id) FROM {TABLE_NAME}), 0) + 1, false)"
+        ))
+        conn.execute(text(f"DROP TABLE {legacy}"))
+    logger.info("Migrated %s to a partitioned table", TABLE_NAME)
+    return True
+
+
+def _archive_month(session, start: datetime, archive_dir: str) -> int:
+    """Write one month of inquiries to its archive file, returning the row count"""
+    end = add_months(start, 1)
+    rows = (
+        session.query(Inquiry)
+        .filter(Inquiry.created_at >= start, Inquiry.created_at < end)
+        .order_by(Inquiry.created_at, Inquiry.id)
+        .yield_per(1000)
+    )
+    path = os.path.join(archive_dir, f"{partition_name(start)}.jsonl.gz")
+    partial = f"{path}.partial"
+    count = 0
+    archive = None
+    try:
+        for row in rows:
+            if archive is None:
+                archive = gzip.open(partial, "wt", encoding="utf-8")
+            archive.write(json.dumps(row.to_dict()) + "\n")
+            count += 1
+    except BaseException:
+        if archive is not None:
+            archive.close()
+            os.remove(partial)
+        raise
+    if archive is not None:
+        archive.close()
+        # Rows are only deleted after this succeeds, so a re-run after a
+        # failure rewrites the whole month instead of appending duplicates
+        os.replace(partial, path)
+    return count
+
+
+def _drop_partition(conn, name: str):
+    """Detach and drop a monthly partition if it exists"""
+    if _exists(conn, name):
+        conn.execute(text(f"ALTER TABLE {TABLE_NAME} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+
+
+def archive_old_partitions(
+    session_factory=SessionLocal,
+    retention_months: int = RETENTION_MONTHS,
+    archive_dir: str = ARCHIVE_DIR,
+    now: datetime = None,
+) -> dict:
+    """
+    Apply the retention policy
+
+    Every calendar month that ends before the retention window is written to
+    `<archive_dir>/inquiries_pYYYY_MM.jsonl.gz` and then removed: on
+    PostgreSQL the monthly partition is detached and dropped (leftover rows
+    in the default partition are deleted), elsewhere the month is deleted
+    by range. Rows are only removed after their archive file is in place.
+
+    The read, detach, drop and delete for a month share one connection and
+    one transaction. DETACH PARTITION takes ACCESS EXCLUSIVE on the parent;
+    issuing it from a second connection would wait forever on the ACCESS
+    SHARE lock held by the read.
+
+    Returns a mapping of partition name to the number of archived rows.
+    """
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = {}
+
+    session = session_factory()
+    try:
+        postgres = is_postgres(session.get_bind())
+        oldest = (
+            session.query(Inquiry.created_at)
+            .filter(Inquiry.created_at < cutoff)
+            .order_by(Inquiry.created_at)
+            .limit(1)
+            .scalar()
+        )
+        session.commit()
+        start = month_start(oldest) if oldest else cutoff
+        while start < cutoff:
+            count = _archive_month(session, start, archive_dir)
+            end = add_months(start, 1)
+            name = partition_name(start)
+
+            if postgres:
+                _drop_partition(session.connection(), name)
+            session.query(Inquiry).filter(
+                Inquiry.created_at >= start, Inquiry.created_at < end
+            ).delete(synchronize_session=False)
+            session.commit()
+
+            if count:
+                archived[name] = count
+                logger.info("Archived %d inquiries from %s", count, name)
+            start = end
+    finally:
+        session.close()
+    return archived
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inquiry table maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("migrate", help="Convert a legacy table to the partitioned layout")
+
+    partitions = sub.add_parser("partitions", help="Create upcoming monthly partitions")
+    partitions.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD)
+
+    archive = sub.add_parser("archive", help="Archive and drop months past retention")
+    archive.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    archive.add_argument("--archive-dir", default=ARCHIVE_DIR)
+
+    run = sub.add_parser("run", help="Create partitions, then apply retention")
+    run.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD)
+    run.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    run.add_argument("--archive-dir", default=ARCHIVE_DIR)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        migrated = migrate_legacy_table()
+        print("Migrated legacy table" if migrated else "Nothing to migrate")
+        return
+    if args.command in ("partitions", "run"):
+        ensure_partitioned_table()
+        ensure_partitions(ahead=args.ahead)
+    if args.command in ("archive", "run"):
+        archived = archive_old_partitions(
+            retention_months=args.retention_months,
+            archive_dir=args.archive_dir,
+        )
+        for name, count in archived.items():
+            print(f"{name}: {count} rows archived")
+        print(f"Archived {sum(archived.values())} inquiries")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,218 @@
+"""
+Autoscaling signals
+
+The services are I/O-bound on PostgreSQL, so CPU is a late signal for the
+HPA. This module tracks, per process:
+
+- requests in flight (instantaneous and time-averaged over the window)
+- rolling latency-SLO attainment: share of requests faster than LATENCY_SLO_MS
+- time spent waiting for a connection from the SQLAlchemy pool
+
+and serves them in Prometheus text format from GET /metrics, where the
+Prometheus Adapter picks them up as custom pod metrics
+(see k8s/autoscaling/).
+
+Environment:
+    LATENCY_SLO_MS           Latency objective per request (default: 300)
+    METRICS_WINDOW_SECONDS   Rolling window for averages and ratios (default: 60)
+"""
+from collections import deque
+import os
+import threading
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import queue as sqla_queue
+
+LATENCY_SLO_MS = float(os.getenv("LATENCY_SLO_MS", "300"))
+METRICS_WINDOW_SECONDS = int(os.getenv("METRICS_WINDOW_SECONDS", "60"))
+
+# Probes and scrapes would dilute the SLO and in-flight signals
+EXCLUDED_PATHS = {"/health", "/metrics"}
+
+
+class RollingWindow:
+    """
+    Observations over the last `seconds`, aggregated into one-second buckets
+
+    Recording is O(1); reading sums at most `seconds` buckets.
+    """
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self._buckets = deque()  # [second, count, good, total, max]
+        self._lock = threading.Lock()
+
+    def _trim(self, now: int):
+        while self._buckets and self._buckets[0][0] <= now - self.seconds:
+            self._buckets.popleft()
+
+    def add(self, value: float, good: bool = True):
+        now = int(time.monotonic())
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != now:
+                self._buckets.append([now, 0, 0, 0.0, 0.0])
+                self._trim(now)
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += good
+            bucket[3] += value
+            bucket[4] = max(bucket[4], value)
+
+    def totals(self):
+        """(count, good, sum, max) over the window"""
+        with self._lock:
+            self._trim(int(time.monotonic()))
+            count = sum(b[1] for b in self._buckets)
+            good = sum(b[2] for b in self._buckets)
+            total = sum(b[3] for b in self._buckets)
+            peak = max((b[4] for b in self._buckets), default=0.0)
+        return count, good, total, peak
+
+
+class ServiceMetrics:
+    """
+    Request and connection-pool signals for one service process
+
+    Attributes:
+        slo_seconds: Latency objective; faster requests count as good
+        window: Rolling window length in seconds
+    """
+
+    def __init__(self, slo_ms: float = LATENCY_SLO_MS, window: int = METRICS_WINDOW_SECONDS):
+        self.slo_seconds = slo_ms / 1000
+        self.window = window
+        self.requests = RollingWindow(window)
+        self.pool_waits = RollingWindow(window)
+        self.pool = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def request_started(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def request_finished(self, duration: float):
+        with self._lock:
+            self._in_flight -= 1
+        self.requests.add(duration, good=duration <= self.slo_seconds)
+
+    def watch_pool(self, pool):
+        """Report checked-out connections for `pool` (waits come from TimedQueuePool)"""
+        self.pool = pool
+
+    def snapshot(self) -> dict:
+        count, good, busy, _ = self.requests.totals()
+        waits, _, wait_total, wait_max = self.pool_waits.totals()
+        elapsed = min(self.window, max(time.monotonic() - self._started, 1.0))
+        attainment = good / count if count else 1.0
+        values = {
+            "http_requests_in_flight": self._in_flight,
+            # Little's law: busy request-seconds per second = average concurrency
+            "http_requests_in_flight_avg": busy / elapsed,
+            "http_requests_window_total": count,
+            "http_request_latency_slo_target_seconds": self.slo_seconds,
+            "http_request_latency_slo_attainment": attainment,
+            "http_request_latency_slo_violation_ratio": 1.0 - attainment,
+            "db_pool_wait_seconds_avg": wait_total / waits if waits else 0.0,
+            "db_pool_wait_seconds_max": wait_max,
+            "process_cpu_seconds_total": time.process_time(),
+        }
+        if self.pool is not None and hasattr(self.pool, "checkedout"):
+            values["db_pool_checked_out"] = self.pool.checkedout()
+            values["db_pool_size"] = self.pool.size()
+        return values
+
+    def render(self) -> str:
+        """Prometheus text exposition of the current snapshot"""
+        lines = []
+        for name, value in self.snapshot().items():
+            kind = "counter" if name == "process_cpu_seconds_total" else "gauge"
+            lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+METRIC_HELP = {
+    "http_requests_in_flight": "Requests currently being handled",
+    "http_requests_in_flight_avg": "Average concurrent requests over the window",
+    "http_requests_window_total": "Requests completed within the window",
+    "http_request_latency_slo_target_seconds": "Latency objective per request",
+    "http_request_latency_slo_attainment": "Share of requests in the window within the latency objective",
+    "http_request_latency_slo_violation_ratio": "Share of requests in the window slower than the latency objective",
+    "db_pool_wait_seconds_avg": "Average wait for a pooled database connection over the window",
+    "db_pool_wait_seconds_max": "Longest wait for a pooled database connection over the window",
+    "db_pool_checked_out": "Database connections currently checked out",
+    "db_pool_size": "Configured database pool size",
+    "process_cpu_seconds_total": "CPU time consumed by this process",
+}
+
+
+metrics = ServiceMetrics()
+
+
+# Wait accumulated by the checkout running on this thread (None outside one)
+_checkout = threading.local()
+
+
+class _TimedQueue(sqla_queue.Queue):
+    """Pool queue that adds time blocked in get() to the current checkout"""
+
+    def get(self, block=True, timeout=None):
+        if getattr(_checkout, "waited", None) is None:
+            return super().get(block, timeout)
+        started = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            _checkout.waited += time.perf_counter() - started
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection
+
+    Only time blocked on the pool queue counts. Opening a new connection
+    (TCP connect and auth) is not a wait, and QueuePool._do_get recursing
+    into itself still records the checkout once.
+    """
+
+    _queue_class = _TimedQueue
+
+    def _do_get(self):
+        if getattr(_checkout, "waited", None) is not None:
+            return super()._do_get()
+        _checkout.waited = 0.0
+        try:
+            return super()._do_get()
+        finally:
+            metrics.pool_waits.add(_checkout.waited)
+            _checkout.waited = None
+
+
+def install_metrics(app: FastAPI):
+    """Track requests handled by `app` and serve GET /metrics"""
+
+    @app.middleware("http")
+    async def track_requests(request: Request, call_next):
+        if request.url.path in EXCLUDED_PATHS:
+            return await call_next(request)
+        metrics.request_started()
+        started = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            metrics.request_finished(time.perf_counter() - started)
+
+    @app.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+    def get_metrics():
+        """Autoscaling signals in Prometheus text format"""
+        return metrics.render()
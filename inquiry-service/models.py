@@ -1,7 +1,7 @@
 """
 Database models for Inquiry Service
 """
-from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy import Column, String, Integer, DateTime, Index
 from sqlalchemy.sql import func
 from database import Base
 
@@ -18,16 +18,25 @@ class Inquiry(Base):
         phone: Customer phone number
         message: Inquiry message
         created_at: Timestamp when inquiry was created
+
+    On PostgreSQL the table is range-partitioned by month on created_at
+    (see maintenance.py). Reads are always "recent inquiries for a plot",
+    so the composite (plot_id, created_at DESC) index serves both the
+    filter and the ordering.
     """
     __tablename__ = "inquiries"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    plot_id = Column(String, nullable=False, index=True)
+    plot_id = Column(String, nullable=False)
     name = Column(String, nullable=False)
     email = Column(String, nullable=False)
     phone = Column(String, nullable=False)
     message = Column(String, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_inquiries_plot_id_created_at", plot_id, created_at.desc()),
+    )
 
     def to_dict(self):
         """Convert model to dictionary"""
@@ -0,0 +1,115 @@
+"""
+Structured, sampled request logging
+
+Log records are rendered as one JSON object per line. Messages use lazy
+%-style arguments, so nothing is formatted unless a record is emitted.
+A middleware writes one access line per request and decides, per request,
+whether that request's INFO/DEBUG records are kept (LOG_SAMPLE_RATE).
+Warnings and errors are always kept, and so are the access lines of failed
+or slow requests.
+
+Environment:
+    LOG_LEVEL             Root log level (default: INFO)
+    LOG_FORMAT            json or text (default: json)
+    LOG_SAMPLE_RATE       Fraction of requests whose INFO logs are kept (default: 1.0)
+    LOG_SLOW_REQUEST_MS   Requests at or above this duration are always logged (default: 1000)
+"""
+from contextvars import ContextVar
+import json
+import logging
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", "1000"))
+
+# Whether the current request was picked for INFO-level logging
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+access_logger = logging.getLogger("access")
+
+
+class StructuredFormatter(logging.Formatter):
+    """Render a record and its `extra` fields as a single JSON object"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Drop INFO and below for requests that were not sampled"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+def configure_logging(service: str):
+    """Install the structured handler on the root logger"""
+    handler = logging.StreamHandler()
+    handler.addFilter(SamplingFilter())
+    if LOG_FORMAT == "json":
+        handler.setFormatter(StructuredFormatter(service))
+    else:
+        handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+
+
+def install_request_logging(app: FastAPI):
+    """Add the per-request access log and sampling decision to `app`"""
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        token = _sampled.set(LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE)
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            level = logging.INFO
+            if status_code >= 500 or duration_ms >= LOG_SLOW_REQUEST_MS:
+                level = logging.WARNING
+            if access_logger.isEnabledFor(level):
+                access_logger.log(
+                    level,
+                    "%s %s %s",
+                    request.method,
+                    request.url.path,
+                    status_code,
+                    extra={
+                        "method": request.method,
+                        "path": request.url.path,
+                        "status": status_code,
+                        "duration_ms": round(duration_ms, 2),
+                    },
+                )
+            _sampled.reset(token)
@@ -3,12 +3,30 @@ Tests for Inquiry Service
 """
 import pytest
 import os
+import logging
+import sqlite3
+import threading
+import time
+import gzip
+import json
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from fastapi import FastAPI, HTTPException
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 
 from main import app
 from database import Base, get_db
+from models import Inquiry
+import maintenance
+from maintenance import archive_old_partitions
+from slow_query import SlowQueryRecorder
+import request_logging
+from request_logging import SamplingFilter, StructuredFormatter, install_request_logging
+from metrics import ServiceMetrics, RollingWindow, TimedQueuePool, metrics as service_metrics
 
 # Use file-based SQLite for testing but delete it first
 TEST_DB = "test_inquiries_temp.db"
@@ -99,5 +117,394 @@ def test_filter_by_plot_id():
     assert all(item["plot_id"] == "PLOT999" for item in data)
 
 
+def test_inquiries_most_recent_first():
+    """Test inquiries for a plot are returned newest first"""
+    db = TestingSessionLocal()
+    for day in (3, 1, 2):
+        db.add(Inquiry(
+            plot_id="PLOT_ORDER",
+            name="Ordered",
+            email="order@example.com",
+            phone="+94771234569",
+            message=f"Day {day}",
+            created_at=datetime(2024, 5, day, tzinfo=timezone.utc)
+        ))
+    db.commit()
+    db.close()
+
+    response = client.get("/inquiries?plot_id=PLOT_ORDER")
+    assert response.status_code == 200
+    assert [item["message"] for item in response.json()] == ["Day 3", "Day 2", "Day 1"]
+
+
+def test_archive_old_partitions(tmp_path):
+    """Test retention archives months past the window and removes them"""
+    db = TestingSessionLocal()
+    for month in (1, 2, 6):
+        db.add(Inquiry(
+            plot_id="PLOT_ARCHIVE",
+            name="Old",
+            email="old@example.com",
+            phone="+94771234570",
+            message=f"Month {month}",
+            created_at=datetime(2020, month, 15, tzinfo=timezone.utc)
+        ))
+    db.commit()
+    db.close()
+
+    archived = archive_old_partitions(
+        session_factory=TestingSessionLocal,
+        retention_months=2,
+        archive_dir=str(tmp_path),
+        now=datetime(2020, 6, 20, tzinfo=timezone.utc)
+    )
+    assert archived == {"inquiries_p2020_01": 1, "inquiries_p2020_02": 1}
+
+    with gzip.open(tmp_path / "inquiries_p2020_01.jsonl.gz", "rt") as archive:
+        rows = [json.loads(line) for line in archive]
+    assert [row["message"] for row in rows] == ["Month 1"]
+
+    remaining = client.get("/inquiries?plot_id=PLOT_ARCHIVE").json()
+    assert [item["message"] for item in remaining] == ["Month 6"]
+
+
+def _add_old_inquiry(message, created_at):
+    db = TestingSessionLocal()
+    db.add(Inquiry(
+        plot_id="PLOT_RETENTION",
+        name="Old",
+        email="old@example.com",
+        phone="+94771234571",
+        message=message,
+        created_at=created_at
+    ))
+    db.commit()
+    db.close()
+
+
+def test_archive_rerun_does_not_duplicate_rows(tmp_path):
+    """Test a re-run after a failed delete rewrites the archive instead of appending"""
+    _add_old_inquiry("Retry", datetime(2019, 3, 10, tzinfo=timezone.utc))
+    start = datetime(2019, 3, 1, tzinfo=timezone.utc)
+
+    # Archive written, then the job died before the delete committed
+    db = TestingSessionLocal()
+    assert maintenance._archive_month(db, start, str(tmp_path)) == 1
+    db.close()
+
+    archived = archive_old_partitions(
+        session_factory=TestingSessionLocal,
+        retention_months=1,
+        archive_dir=str(tmp_path),
+        now=datetime(2019, 5, 1, tzinfo=timezone.utc)
+    )
+    assert archived == {"inquiries_p2019_03": 1}
+
+    with gzip.open(tmp_path / "inquiries_p2019_03.jsonl.gz", "rt") as archive:
+        rows = [json.loads(line) for line in archive]
+    assert [row["message"] for row in rows] == ["Retry"]
+    assert list(tmp_path.iterdir()) == [tmp_path / "inquiries_p2019_03.jsonl.gz"]
+
+
+def test_archive_drops_partition_in_read_transaction(tmp_path, monkeypatch):
+    """Test the PostgreSQL branch detaches on the connection that read the month"""
+    _add_old_inquiry("Partitioned", datetime(2018, 7, 4, tzinfo=timezone.utc))
+    sessions = []
+    dropped = []
+
+    def session_factory():
+        session = TestingSessionLocal()
+        sessions.append(session)
+        return session
+
+    def drop_partition(conn, name):
+        # A second connection would block on the read's ACCESS SHARE lock
+        assert conn is sessions[0].connection()
+        assert conn.in_transaction()
+        dropped.append(name)
+
+    monkeypatch.setattr(maintenance, "is_postgres", lambda bind: True)
+    monkeypatch.setattr(maintenance, "_drop_partition", drop_partition)
+
+    archived = archive_old_partitions(
+        session_factory=session_factory,
+        retention_months=1,
+        archive_dir=str(tmp_path),
+        now=datetime(2018, 9, 1, tzinfo=timezone.utc)
+    )
+    assert archived == {"inquiries_p2018_07": 1}
+    assert dropped == ["inquiries_p2018_07"]
+    assert len(sessions) == 1
+
+
+class FakePostgres:
+    """
+    Engine and connection stand-in that records SQL and answers lookups by substring
+
+    An answer may be a callable, which receives the statement's parameters.
+    """
+
+    dialect = SimpleNamespace(name="postgresql")
+
+    def __init__(self, answers=None):
+        self.answers = answers or {}
+        self.statements = []
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    begin_nested = begin
+
+    def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.statements.append(sql)
+        value = next((v for needle, v in self.answers.items() if needle in sql), None)
+        if callable(value):
+            value = value(params or {})
+        return SimpleNamespace(scalar=lambda: value)
+
+
+def test_ensure_partitions_skips_legacy_table():
+    """Test partition creation is skipped, not failed, on an unpartitioned table"""
+    conn = FakePostgres({"relkind": "r"})
+    assert maintenance.ensure_partitions(conn, ahead=3) == 0
+    assert not any("PARTITION OF" in sql for sql in conn.statements)
+
+
+def test_ensure_partitioned_table_locks_before_checking():
+    """Test replicas starting together serialise on the schema lock before the existence check"""
+    conn = FakePostgres({"IS NOT NULL": True})
+    maintenance.ensure_partitioned_table(conn)
+    assert conn.statements[0].startswith("SELECT pg_advisory_xact_lock")
+    assert "to_regclass" in conn.statements[1]
+    assert len(conn.statements) == 2
+
+
+def test_ensure_schema_creates_tables(tmp_path):
+    """Test startup schema setup on a fresh database"""
+    fresh = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    maintenance.ensure_schema(fresh)
+    maintenance.ensure_schema(fresh)
+    names = {index["name"] for index in inspect(fresh).get_indexes("inquiries")}
+    assert "ix_inquiries_plot_id_created_at" in names
+    fresh.dispose()
+
+
+def test_create_partition_moves_rows_out_of_default():
+    """Test a month with rows in the default partition is split out instead of failing"""
+    conn = FakePostgres({
+        "to_regclass": lambda params: params["name"] == maintenance.DEFAULT_PARTITION,
+        "SELECT EXISTS": True,
+    })
+    maintenance.create_partition(conn, datetime(2024, 5, 1, tzinfo=timezone.utc))
+    ddl = [sql.split(" (")[0] for sql in conn.statements if not sql.startswith("SELECT")]
+    assert ddl == [
+        "ALTER TABLE inquiries DETACH PARTITION inquiries_default",
+        "CREATE TABLE IF NOT EXISTS inquiries_p2024_05 PARTITION OF inquiries FOR VALUES FROM",
+        "INSERT INTO inquiries",
+        "DELETE FROM inquiries_default WHERE created_at >= :start AND created_at < :end",
+        "ALTER TABLE inquiries ATTACH PARTITION inquiries_default DEFAULT",
+    ]
+
+
+def test_ensure_partitions_continues_past_a_failed_month(monkeypatch, caplog):
+    """Test one failing month is logged and the remaining months are still created"""
+    created = []
+
+    def create_partition(conn, start):
+        if start.month == datetime.now(timezone.utc).month:
+            raise OperationalError("CREATE TABLE", {}, Exception("partition constraint violated"))
+        created.append(start)
+
+    monkeypatch.setattr(maintenance, "create_partition", create_partition)
+    assert maintenance.ensure_partitions(FakePostgres({"relkind": "p"}), ahead=3) == 3
+    assert len(created) == 3
+    assert "Could not create partition" in caplog.text
+
+
+def test_ensure_indexes_upgrades_legacy_table(tmp_path):
+    """Test databases created before the composite index get it at startup"""
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE inquiries (id INTEGER PRIMARY KEY, plot_id VARCHAR, name VARCHAR, "
+            "email VARCHAR, phone VARCHAR, message VARCHAR, created_at DATETIME)"
+        ))
+        conn.execute(text("CREATE INDEX ix_inquiries_plot_id ON inquiries (plot_id)"))
+
+    maintenance.ensure_indexes(legacy)
+    maintenance.ensure_indexes(legacy)
+    names = {index["name"] for index in inspect(legacy).get_indexes("inquiries")}
+    assert names == {"ix_inquiries_plot_id_created_at"}
+    legacy.dispose()
+
+
+def test_metrics_endpoint():
+    """Test autoscaling signals are exposed in Prometheus format"""
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    for name in (
+        "http_requests_in_flight",
+        "http_request_latency_slo_attainment",
+        "db_pool_wait_seconds_avg",
+    ):
+        assert f"# TYPE {name} gauge" in body
+
+
+def test_latency_slo_attainment():
+    """Test the rolling SLO ratio and average concurrency"""
+    tracker = ServiceMetrics(slo_ms=100, window=60)
+    for duration in (0.05, 0.05, 0.05, 0.5):
+        tracker.request_started()
+        tracker.request_finished(duration)
+    snapshot = tracker.snapshot()
+    assert snapshot["http_requests_in_flight"] == 0
+    assert snapshot["http_requests_window_total"] == 4
+    assert snapshot["http_request_latency_slo_attainment"] == 0.75
+    assert snapshot["http_requests_in_flight_avg"] > 0
+
+
+def test_pool_wait_excludes_connect_time(monkeypatch):
+    """Test only time blocked on the pool counts as a wait, once per checkout"""
+    waits = RollingWindow(60)
+    monkeypatch.setattr(service_metrics, "pool_waits", waits)
+
+    def slow_connect():
+        time.sleep(0.05)
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    pool = TimedQueuePool(slow_connect, pool_size=1, max_overflow=0, timeout=5)
+    first = pool.connect()
+    count, _, total, _ = waits.totals()
+    assert count == 1
+    assert total < 0.02
+
+    threading.Timer(0.1, first.close).start()
+    second = pool.connect()
+    count, _, _, peak = waits.totals()
+    assert count == 2
+    assert peak >= 0.08
+    second.close()
+    pool.dispose()
+
+
+class RecordingHandler(logging.Handler):
+    """Collects records that pass the sampling filter"""
+
+    def __init__(self):
+        super().__init__()
+        self.addFilter(SamplingFilter())
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _sampling_app():
+    sampled_app = FastAPI()
+    install_request_logging(sampled_app)
+    app_logger = logging.getLogger("sampling-test")
+
+    @sampled_app.get("/work")
+    def work():
+        app_logger.info("routine detail")
+        app_logger.warning("something odd")
+        return {"ok": True}
+
+    @sampled_app.get("/slow")
+    def slow():
+        time.sleep(0.06)
+        return {"ok": True}
+
+    @sampled_app.get("/fail")
+    def fail():
+        raise HTTPException(status_code=503, detail="down")
+
+    return sampled_app
+
+
+def test_unsampled_request_keeps_only_warnings(monkeypatch):
+    """Test an unsampled request drops INFO but keeps WARNING, slow and failed requests"""
+    monkeypatch.setattr(request_logging, "LOG_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(request_logging, "LOG_SLOW_REQUEST_MS", 50)
+    handler = RecordingHandler()
+    logging.getLogger().addHandler(handler)
+    try:
+        sampled_client = TestClient(_sampling_app())
+        sampled_client.get("/work")
+        sampled_client.get("/slow")
+        sampled_client.get("/fail")
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+    messages = [(r.levelname, r.getMessage()) for r in handler.records]
+    assert ("WARNING", "something odd") in messages
+    assert not any(message == "routine detail" for _, message in messages)
+    assert ("WARNING", "GET /slow 200") in messages
+    assert ("WARNING", "GET /fail 503") in messages
+    assert not any(message == "GET /work 200" for _, message in messages)
+
+
+def test_sampled_request_keeps_info(monkeypatch):
+    """Test a sampled request keeps its INFO records and access line"""
+    monkeypatch.setattr(request_logging, "LOG_SAMPLE_RATE", 1.0)
+    handler = RecordingHandler()
+    logging.getLogger().addHandler(handler)
+    try:
+        TestClient(_sampling_app()).get("/work")
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+    messages = [r.getMessage() for r in handler.records]
+    assert "routine detail" in messages
+    assert "GET /work 200" in messages
+
+
+def test_structured_formatter_includes_extra_fields():
+    """Test records render as one JSON object including `extra` fields"""
+    record = logging.getLogger("access").makeRecord(
+        "access", logging.INFO, __file__, 1, "%s %s", ("GET", "/health"), None,
+        extra={"status": 200, "duration_ms": 1.5}
+    )
+    entry = json.loads(StructuredFormatter("test-service").format(record))
+    assert entry["msg"] == "GET /health"
+    assert entry["service"] == "test-service"
+    assert entry["level"] == "INFO"
+    assert entry["status"] == 200
+    assert entry["duration_ms"] == 1.5
+
+
+def test_slow_query_recorder():
+    """Test slow statements are captured with parameter shapes and a plan"""
+    recorder = SlowQueryRecorder(threshold_ms=0, capacity=2)
+    recorder.attach(engine)
+    try:
+        db = TestingSessionLocal()
+        for _ in range(3):
+            db.query(Inquiry).filter(Inquiry.plot_id == "PLOT001").all()
+        db.close()
+    finally:
+        recorder.detach(engine)
+
+    entries = recorder.entries()
+    assert len(entries) == 2  # bounded ring buffer
+    assert "FROM inquiries" in entries[0]["statement"]
+    assert "str" in entries[0]["parameters"]
+    assert "PLOT001" not in str(entries[0]["parameters"])
+    assert any("ix_inquiries_plot_id_created_at" in line for line in entries[0]["plan"])
+
+
+def test_slow_query_endpoint():
+    """Test the admin slow-query endpoint"""
+    response = client.get("/admin/slow-queries")
+    assert response.status_code == 200
+    data = response.json()
+    assert "enabled" in data
+    assert isinstance(data["queries"], list)
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,221 @@
+"""
+Write hooks for listings
+
+Every successful create, update or delete publishes a ListingChange after
+the transaction commits. Subscribers use it to keep derived state (caches,
+search indexes, counters) current incrementally instead of rebuilding it
+from the table.
+
+Built-in subscriber:
+    listing_index - in-memory per-plot summary with availability counters,
+                    served from GET /listings/counts
+
+Each replica only sees its own writes, so derived state is also re-seeded
+from the database every LISTING_INDEX_TTL_SECONDS (default: 60).
+"""
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from models import Listing
+
+logger = logging.getLogger(__name__)
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+
+@dataclass(frozen=True)
+class ListingChange:
+    """
+    A committed write to a listing
+
+    Attributes:
+        kind: created, updated or deleted
+        plot_id: The listing that changed
+        listing: Row state after the write (None for deletes)
+        version: Row version the write produced; for deletes, the version removed
+    """
+    kind: str
+    plot_id: str
+    listing: Optional[dict] = None
+    version: Optional[int] = None
+
+    @property
+    def row_version(self) -> Optional[int]:
+        if self.listing is not None:
+            return self.listing.get("version", self.version)
+        return self.version
+
+
+_subscribers: List[Callable[[ListingChange], None]] = []
+
+
+def subscribe(handler: Callable[[ListingChange], None]):
+    """Register a handler for listing changes (usable as a decorator)"""
+    _subscribers.append(handler)
+    return handler
+
+
+def unsubscribe(handler: Callable[[ListingChange], None]):
+    if handler in _subscribers:
+        _subscribers.remove(handler)
+
+
+def publish(change: ListingChange):
+    """
+    Deliver a change to every subscriber
+
+    A failing subscriber is logged and skipped; the write has already been
+    committed and must not be reported as failed.
+    """
+    for handler in list(_subscribers):
+        try:
+            handler(change)
+        except Exception:
+            logger.exception("Listing hook %s failed for %s", handler, change.plot_id)
+
+
+class ListingIndex:
+    """
+    In-memory summary of listings maintained from change events
+
+    Keeps (category, available, version) per plot and counters by category
+    and availability. Loaded from the database on first use and re-seeded
+    after `ttl` seconds; in between, changes are applied as deltas.
+
+    Changes are published after commit, so two writers to the same plot can
+    deliver them out of order. A create or update whose version is at or
+    below the one already held for the plot is ignored, a delete only if it
+    is older. Deletes leave a tombstone for `tombstone_ttl` seconds so a late
+    update cannot resurrect the row; a plot re-created within that window
+    (its version starts again at 1) shows up at the next re-seed.
+    """
+
+    def __init__(self, ttl: float = 60.0, tombstone_ttl: float = 10.0):
+        self.ttl = ttl
+        self.tombstone_ttl = tombstone_ttl
+        self._rows = {}
+        self._tombstones = {}  # plot_id -> (deleted version, monotonic time)
+        self._counts = Counter()
+        self._loaded_at = None
+        # One buffer per load() in progress; changes published while it reads
+        # the table are replayed onto its snapshot
+        self._loading = []
+        self._lock = threading.Lock()
+
+    def _add(self, plot_id: str, category: str, available: bool, version: Optional[int]):
+        self._rows[plot_id] = (category, bool(available), version)
+        self._counts[(category, bool(available))] += 1
+
+    def _remove(self, plot_id: str):
+        old = self._rows.pop(plot_id, None)
+        if old is not None:
+            key = old[:2]
+            self._counts[key] -= 1
+            if self._counts[key] <= 0:
+                del self._counts[key]
+
+    def _is_stale(self, change: ListingChange, now: float) -> bool:
+        plot_id, version = change.plot_id, change.row_version
+        if version is None:
+            return False
+        current = self._rows.get(plot_id)
+        if current is not None and current[2] is not None:
+            # A delete carries the version it removed, so it matches the current row
+            if version < current[2] or (version == current[2] and change.listing is not None):
+                return True
+        tombstone = self._tombstones.get(plot_id)
+        if tombstone is None or change.listing is None:
+            return False
+        deleted_version, deleted_at = tombstone
+        if now - deleted_at >= self.tombstone_ttl:
+            del self._tombstones[plot_id]
+            return False
+        return deleted_version is not None and version <= deleted_version
+
+    def _apply(self, change: ListingChange):
+        now = time.monotonic()
+        if self._is_stale(change, now):
+            return
+        version = change.row_version
+        self._remove(change.plot_id)
+        if change.listing is not None:
+            self._tombstones.pop(change.plot_id, None)
+            self._add(change.plot_id, change.listing["category"], change.listing["available"], version)
+        else:
+            self._tombstones[change.plot_id] = (version, now)
+
+    def _expire_tombstones(self):
+        now = time.monotonic()
+        for plot_id, (_, deleted_at) in list(self._tombstones.items()):
+            if now - deleted_at >= self.tombstone_ttl:
+                del self._tombstones[plot_id]
+
+    def load(self, db: Session):
+        """Rebuild from the listings table, keeping changes published during the read"""
+        pending = []
+        with self._lock:
+            self._loading.append(pending)
+        try:
+            rows = db.query(
+                Listing.plot_id, Listing.category, Listing.available, Listing.version
+            ).all()
+        except BaseException:
+            with self._lock:
+                self._loading.remove(pending)
+            raise
+        with self._lock:
+            self._loading.remove(pending)
+            self._rows = {}
+            self._counts = Counter()
+            self._expire_tombstones()
+            for row in rows:
+                self._add(row.plot_id, row.category, row.available, row.version)
+            # Replayed changes go through the same version check, so one the
+            # snapshot already contains (or has superseded) is ignored
+            for change in pending:
+                self._apply(change)
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def apply(self, change: ListingChange):
+        """Apply one change as a delta (buffered for a load in progress, else ignored until loaded)"""
+        with self._lock:
+            for pending in self._loading:
+                pending.append(change)
+            if self._loaded_at is not None:
+                self._apply(change)
+
+    def _ensure_loaded(self, db: Session):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at >= self.ttl:
+            self.load(db)
+
+    def counts(self, db: Session) -> dict:
+        """Listing counters by category and availability"""
+        self._ensure_loaded(db)
+        with self._lock:
+            by_category = {}
+            for (category, available), count in self._counts.items():
+                entry = by_category.setdefault(category, {"available": 0, "unavailable": 0})
+                entry["available" if available else "unavailable"] += count
+            return {
+                "total": len(self._rows),
+                "available": sum(e["available"] for e in by_category.values()),
+                "by_category": by_category,
+            }
+
+
+listing_index = ListingIndex(ttl=float(os.getenv("LISTING_INDEX_TTL_SECONDS", "60")))
+subscribe(listing_index.apply)
@@ -4,21 +4,30 @@ Listing Service - Microservice for managing property listings
 This service provides APIs to:
 - Create new property listings
 - Retrieve all listings
+- Update and delete listings (optimistic locking on `version`)
+- Price statistics by category and location
 - Health check endpoint
+- Slow-query log (admin)
 
 Database: PostgreSQL
 """
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Response, status
+from sqlalchemy import delete, inspect, text, update
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import logging
 
-from database import engine, get_db, Base
+from database import engine, get_db, Base, slow_query_recorder
 from models import Listing
-from schemas import ListingCreate, ListingResponse
+from schemas import ListingCreate, ListingUpdate, ListingResponse, PriceStatsResponse
+from hooks import ListingChange, CREATED, UPDATED, DELETED, publish, listing_index
+from stats import price_stats
+from request_logging import configure_logging, install_request_logging
+from metrics import install_metrics
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure structured, sampled logging
+configure_logging("listing-service")
 logger = logging.getLogger(__name__)
 
 # Create FastAPI app
@@ -27,12 +36,44 @@ app = FastAPI(
     description="Microservice for managing property listings",
     version="1.0.0"
 )
+install_request_logging(app)
+install_metrics(app)
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 logger.info("Database tables created successfully")
 
 
+def ensure_version_column(bind=engine):
+    """
+    Add the version column to listings tables created before optimistic locking
+
+    Safe when several replicas start together: PostgreSQL uses
+    ADD COLUMN IF NOT EXISTS, and elsewhere the duplicate-column error from
+    losing the race is ignored.
+    """
+    if "version" in {c["name"] for c in inspect(bind).get_columns(Listing.__tablename__)}:
+        return
+    if bind.dialect.name == "postgresql":
+        statement = "ALTER TABLE listings ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1"
+    else:
+        statement = "ALTER TABLE listings ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+    try:
+        with bind.begin() as conn:
+            conn.execute(text(statement))
+    except OperationalError as exc:
+        if "duplicate column" not in str(exc).lower():
+            raise
+        return
+    logger.info("Added version column to listings")
+
+
+@app.on_event("startup")
+def migrate_schema():
+    """Schema upgrades run when the server starts, not when the module is imported"""
+    ensure_version_column()
+
+
 @app.get("/health", tags=["Health"])
 def health_check():
     """
@@ -71,7 +112,7 @@ def create_listing(
     # Check if plot_id already exists
     existing = db.query(Listing).filter(Listing.plot_id == listing_data.plot_id).first()
     if existing:
-        logger.warning(f"Duplicate plot_id attempted: {listing_data.plot_id}")
+        logger.warning("Duplicate plot_id attempted: %s", listing_data.plot_id)
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"Listing with plot_id '{listing_data.plot_id}' already exists"
@@ -84,11 +125,12 @@ def create_listing(
         db.add(new_listing)
         db.commit()
         db.refresh(new_listing)
-        logger.info(f"Created listing: {new_listing.plot_id}")
+        logger.info("Created listing: %s", new_listing.plot_id)
+        publish(ListingChange(CREATED, new_listing.plot_id, new_listing.to_dict()))
         return new_listing
     except Exception as e:
         db.rollback()
-        logger.error(f"Error creating listing: {str(e)}")
+        logger.error("Error creating listing: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create listing"
@@ -118,16 +160,216 @@ def get_all_listings(
     """
     try:
         listings = db.query(Listing).offset(skip).limit(limit).all()
-        logger.info(f"Retrieved {len(listings)} listings")
+        logger.info("Retrieved %d listings", len(listings))
         return listings
     except Exception as e:
-        logger.error(f"Error retrieving listings: {str(e)}")
+        logger.error("Error retrieving listings: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to retrieve listings"
         )
 
 
+@app.get("/listings/counts", tags=["Listings"])
+def get_listing_counts(db: Session = Depends(get_db)):
+    """
+    Listing counts by category and availability
+
+    Served from the in-memory listing index, which write hooks keep current.
+    """
+    return listing_index.counts(db)
+
+
+@app.get(
+    "/listings/stats",
+    response_model=PriceStatsResponse,
+    tags=["Listings"]
+)
+def get_price_stats(
+    category: Optional[str] = Query(None, pattern="^(Sale|Rent)$"),
+    location: Optional[str] = None,
+    buckets: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """
+    Price distribution per category: count, mean, percentiles and histogram
+    
+    Args:
+        category: Optional filter, Sale or Rent
+        location: Optional case-insensitive location prefix (e.g. "colombo")
+        buckets: Number of equal-width histogram buckets (default: 10)
+        db: Database session
+    
+    Returns:
+        Statistics per category; computed in SQL on PostgreSQL, otherwise
+        with NumPy, and cached until the next listing write
+    """
+    try:
+        return price_stats(db, category, location, buckets)
+    except Exception as e:
+        logger.error("Error computing price stats: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to compute price statistics"
+        )
+
+
+def _version_conflict(db: Session, plot_id: str, expected: int):
+    """
+    Explain why a versioned write matched no row: missing listing or stale version
+    """
+    current = db.query(Listing.version).filter(Listing.plot_id == plot_id).scalar()
+    if current is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Listing with plot_id '{plot_id}' not found"
+        )
+    logger.warning("Version conflict on %s: expected %s, current %s", plot_id, expected, current)
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"Listing '{plot_id}' was modified (version {current}, expected {expected})"
+    )
+
+
+@app.patch(
+    "/listings/{plot_id}",
+    response_model=ListingResponse,
+    tags=["Listings"]
+)
+def update_listing(
+    plot_id: str,
+    changes: ListingUpdate,
+    db: Session = Depends(get_db)
+):
+    """
+    Partially update a listing (e.g. price or availability)
+    
+    Args:
+        plot_id: Listing to update
+        changes: Fields to change, plus the version they are based on
+        db: Database session
+    
+    Returns:
+        Updated listing with its new version
+    
+    Raises:
+        HTTPException: 404 if the listing does not exist, 409 if its version changed
+    """
+    values = changes.model_dump(exclude_unset=True, exclude_none=True)
+    expected = values.pop("version")
+    if not values:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No fields to update"
+        )
+
+    # Compare-and-set in a single UPDATE ... RETURNING; no prior SELECT
+    stmt = (
+        update(Listing)
+        .where(Listing.plot_id == plot_id, Listing.version == expected)
+        .values(**values, version=Listing.version + 1)
+        .returning(Listing)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        updated = db.execute(stmt).scalars().first()
+        if updated is None:
+            db.rollback()
+            _version_conflict(db, plot_id, expected)
+        # Snapshot before commit so reading it doesn't trigger a refresh SELECT
+        listing = updated.to_dict()
+        db.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error("Error updating listing %s: %s", plot_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update listing"
+        )
+
+    logger.info("Updated listing %s to version %s", plot_id, listing["version"])
+    publish(ListingChange(UPDATED, plot_id, listing))
+    return listing
+
+
+@app.delete(
+    "/listings/{plot_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    tags=["Listings"]
+)
+def delete_listing(
+    plot_id: str,
+    version: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Delete a listing
+    
+    Args:
+        plot_id: Listing to delete
+        version: If given, only delete when the listing is still at this version
+        db: Database session
+    
+    Raises:
+        HTTPException: 404 if the listing does not exist, 409 if its version changed
+    """
+    stmt = delete(Listing).where(Listing.plot_id == plot_id)
+    if version is not None:
+        stmt = stmt.where(Listing.version == version)
+    try:
+        deleted_version = db.execute(
+            stmt.returning(Listing.version).execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        if deleted_version is None:
+            db.rollback()
+            if version is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Listing with plot_id '{plot_id}' not found"
+                )
+            _version_conflict(db, plot_id, version)
+        db.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error("Error deleting listing %s: %s", plot_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete listing"
+        )
+
+    logger.info("Deleted listing %s", plot_id)
+    publish(ListingChange(DELETED, plot_id, version=deleted_version))
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.get("/admin/slow-queries", tags=["Admin"])
+def get_slow_queries():
+    """
+    Recorded slow SQL statements, newest first
+
+    Each entry has the statement, its duration, the types of its bound
+    parameters and an EXPLAIN plan. Enable with SLOW_QUERY_THRESHOLD_MS.
+    """
+    return {
+        "enabled": slow_query_recorder.enabled,
+        "threshold_ms": slow_query_recorder.threshold_ms,
+        "capacity": slow_query_recorder.capacity,
+        "queries": slow_query_recorder.entries(),
+    }
+
+
+@app.delete("/admin/slow-queries", status_code=status.HTTP_204_NO_CONTENT, tags=["Admin"])
+def clear_slow_queries():
+    """
+    Empty the slow-query buffer
+    """
+    slow_query_recorder.clear()
+
+
 @app.get("/", tags=["Root"])
 def root():
     """
@@ -138,8 +380,14 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "metrics": "/metrics",
             "create_listing": "POST /listings",
             "get_listings": "GET /listings",
+            "update_listing": "PATCH /listings/{plot_id}",
+            "delete_listing": "DELETE /listings/{plot_id}",
+            "listing_counts": "GET /listings/counts",
+            "price_stats": "GET /listings/stats",
+            "slow_queries": "GET /admin/slow-queries",
             "docs": "/docs"
         }
     }
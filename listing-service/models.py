@@ -1,7 +1,7 @@
 """
 Database models for Listing Service
 """
-from sqlalchemy import Column, String, Float, Boolean, DateTime
+from sqlalchemy import Column, String, Float, Boolean, DateTime, Integer
 from sqlalchemy.sql import func
 from database import Base
 
@@ -19,6 +19,7 @@ class Listing(Base):
         available: Availability status (default: True)
         created_at: Timestamp when listing was created
         updated_at: Timestamp when listing was last updated
+        version: Row version for optimistic locking, bumped on every update
     """
     __tablename__ = "listings"
 
@@ -30,6 +31,7 @@ class Listing(Base):
     available = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     def to_dict(self):
         """Convert model to dictionary"""
@@ -42,4 +44,5 @@ class Listing(Base):
             "available": self.available,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "version": self.version,
         }
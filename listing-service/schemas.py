@@ -2,7 +2,7 @@
 Pydantic schemas for request/response validation
 """
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -29,6 +29,26 @@ class ListingCreate(BaseModel):
     available: bool = Field(default=True, description="Availability status")
 
 
+class ListingUpdate(BaseModel):
+    """Schema for partially updating a listing"""
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "price": 45000000.00,
+                "available": False,
+                "version": 1
+            }
+        }
+    )
+
+    title: Optional[str] = Field(None, min_length=1, description="Property title")
+    location: Optional[str] = Field(None, min_length=1, description="Property location")
+    category: Optional[str] = Field(None, pattern="^(Sale|Rent)$", description="Category: Sale or Rent")
+    price: Optional[float] = Field(None, gt=0, description="Price must be positive")
+    available: Optional[bool] = Field(None, description="Availability status")
+    version: int = Field(..., ge=1, description="Version the change is based on")
+
+
 class ListingResponse(BaseModel):
     """Schema for listing response"""
     model_config = ConfigDict(from_attributes=True)
@@ -41,3 +61,34 @@ class ListingResponse(BaseModel):
     available: bool
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    version: int = 1
+
+
+class PriceBucket(BaseModel):
+    """Histogram bucket: lower <= price < upper (the top bucket includes upper)"""
+    lower: float
+    upper: float
+    count: int
+
+
+class CategoryPriceStats(BaseModel):
+    """Price distribution for one category"""
+    category: str
+    count: int
+    min: float
+    max: float
+    mean: float
+    p25: float
+    median: float
+    p75: float
+    p90: float
+    histogram: List[PriceBucket]
+
+
+class PriceStatsResponse(BaseModel):
+    """Schema for price statistics response"""
+    category: Optional[str] = None
+    location: Optional[str] = None
+    buckets: int
+    source: str = Field(..., description="sql (computed in PostgreSQL) or numpy")
+    stats: List[CategoryPriceStats]
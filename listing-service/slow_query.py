@@ -0,0 +1,177 @@
+"""
+Slow-query recorder for SQLAlchemy engines
+
+Opt-in via SLOW_QUERY_THRESHOLD_MS. Statements slower than the threshold
+are kept in a bounded ring buffer together with the shape of their bound
+parameters (types only, never values) and an automatic EXPLAIN of the
+statement, and are served from the admin endpoint.
+
+Environment:
+    SLOW_QUERY_THRESHOLD_MS   Record statements at or above this many ms (unset = off)
+    SLOW_QUERY_BUFFER_SIZE    Number of entries kept (default: 100)
+    SLOW_QUERY_EXPLAIN        Capture an EXPLAIN plan (default: true)
+    SLOW_QUERY_ANALYZE        Use EXPLAIN ANALYZE for SELECTs on PostgreSQL (default: false)
+"""
+from collections import deque
+from datetime import datetime, timezone
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def parameter_shape(parameters):
+    """Describe bound parameters by type only, e.g. {'plot_id_1': 'str'}"""
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class SlowQueryRecorder:
+    """
+    Records slow statements executed on one or more engines
+
+    Attributes:
+        threshold_ms: Minimum duration to record; None disables recording
+        capacity: Maximum number of entries kept (oldest are dropped first)
+        explain: Whether to capture an EXPLAIN plan for each entry
+        analyze: Use EXPLAIN ANALYZE for SELECTs (PostgreSQL only; runs the query again)
+    """
+
+    def __init__(self, threshold_ms=None, capacity=100, explain=True, analyze=False):
+        self.threshold_ms = threshold_ms
+        self.capacity = capacity
+        self.explain = explain
+        self.analyze = analyze
+        self._entries = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        threshold = os.getenv("SLOW_QUERY_THRESHOLD_MS")
+        return cls(
+            threshold_ms=float(threshold) if threshold else None,
+            capacity=int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "100")),
+            explain=_env_flag("SLOW_QUERY_EXPLAIN", True),
+            analyze=_env_flag("SLOW_QUERY_ANALYZE", False),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms is not None
+
+    def attach(self, engine: Engine):
+        """Start timing statements on `engine` (no-op when disabled)"""
+        if not self.enabled:
+            return
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        logger.info("Slow-query recorder attached (threshold %sms)", self.threshold_ms)
+
+    def detach(self, engine: Engine):
+        if event.contains(engine, "before_cursor_execute", self._before_execute):
+            event.remove(engine, "before_cursor_execute", self._before_execute)
+            event.remove(engine, "after_cursor_execute", self._after_execute)
+
+    def entries(self) -> list:
+        """Recorded statements, newest first"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_start", None)
+        if started is None:
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        if executemany:
+            shape = {
+                "executemany": len(parameters),
+                "row": parameter_shape(parameters[0]) if parameters else None,
+            }
+        else:
+            shape = parameter_shape(parameters)
+
+        plan = None
+        if self.explain and not executemany:
+            plan = self._explain(conn, statement, parameters)
+
+        entry = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(duration_ms, 3),
+            "statement": statement,
+            "parameters": shape,
+            "plan": plan,
+        }
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning("Slow query (%.1fms): %.200s", duration_ms, " ".join(statement.split()))
+
+    def _explain(self, conn, statement, parameters):
+        """Run EXPLAIN on a separate DBAPI cursor so the caller's results are untouched"""
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        if verb not in EXPLAINABLE:
+            return None
+
+        dialect = conn.dialect.name
+        if dialect == "sqlite":
+            prefix = "EXPLAIN QUERY PLAN "
+        elif dialect == "postgresql":
+            # ANALYZE executes the statement; only safe for reads
+            prefix = "EXPLAIN ANALYZE " if self.analyze and verb == "SELECT" else "EXPLAIN "
+        else:
+            prefix = "EXPLAIN "
+
+        # A failed statement aborts the surrounding PostgreSQL transaction,
+        # so the EXPLAIN runs inside its own savepoint there
+        savepoint = dialect == "postgresql"
+        cursor = conn.connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute("SAVEPOINT slow_query_explain")
+            cursor.execute(prefix + statement, parameters or ())
+            plan = [" ".join(str(col) for col in row) for row in cursor.fetchall()]
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        except Exception as e:
+            if savepoint:
+                try:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                except Exception:
+                    pass
+            logger.debug("EXPLAIN failed: %s", e)
+            return None
+        finally:
+            cursor.close()
+
+
+recorder = SlowQueryRecorder.from_env()
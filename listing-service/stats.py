@@ -0,0 +1,251 @@
+"""
+Price statistics for listings
+
+Computes count, min/max/mean, percentiles and an equal-width price
+histogram per category (Sale vs Rent), optionally filtered by category
+and location prefix.
+
+On PostgreSQL the aggregation runs in SQL (percentile_cont, width_bucket)
+and only the summary rows come back. Other backends fetch the filtered
+(category, price) columns once and aggregate them with NumPy. Both paths
+use the same definitions: linearly interpolated percentiles and buckets
+that are closed on the left, with the top bucket also including the max.
+
+Results are cached per query and the cache is cleared on every listing
+write (see hooks.py) and after LISTING_STATS_TTL_SECONDS.
+"""
+from collections import OrderedDict
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from models import Listing
+from hooks import subscribe
+
+PERCENTILES = {"p25": 0.25, "median": 0.5, "p75": 0.75, "p90": 0.9}
+
+
+def _filters(category: str = None, location: str = None) -> list:
+    conditions = []
+    if category:
+        conditions.append(Listing.category == category)
+    if location:
+        conditions.append(
+            func.lower(Listing.location).startswith(location.lower(), autoescape=True)
+        )
+    return conditions
+
+
+def _edges(low: float, high: float, buckets: int) -> list:
+    if low == high:
+        return [low, high]
+    return [float(edge) for edge in np.linspace(low, high, buckets + 1)]
+
+
+def _histogram(edges: list, counts) -> list:
+    return [
+        {"lower": edges[i], "upper": edges[i + 1], "count": int(counts[i])}
+        for i in range(len(edges) - 1)
+    ]
+
+
+def sql_statement(category=None, location=None, buckets=10):
+    """
+    Summary and histogram in one statement
+
+    Both come from a single `bounds` CTE, so under READ COMMITTED they see
+    the same snapshot and the histogram edges always match the counts.
+    Returns one row per (category, bucket).
+    """
+    conditions = _filters(category, location)
+    bounds = (
+        select(
+            Listing.category.label("category"),
+            func.count().label("listings"),
+            func.min(Listing.price).label("low"),
+            func.max(Listing.price).label("high"),
+            func.avg(Listing.price).label("mean"),
+            *[
+                func.percentile_cont(q).within_group(Listing.price).label(name)
+                for name, q in PERCENTILES.items()
+            ],
+        )
+        .where(*conditions)
+        .group_by(Listing.category)
+        .cte("bounds")
+    )
+    # width_bucket puts price == high in bucket n + 1; fold it into the top bucket
+    bucket = case(
+        (
+            bounds.c.high > bounds.c.low,
+            func.least(func.width_bucket(Listing.price, bounds.c.low, bounds.c.high, buckets), buckets),
+        ),
+        else_=1,
+    ).label("bucket")
+    bucketed = (
+        select(Listing.category.label("category"), bucket)
+        .join(bounds, bounds.c.category == Listing.category)
+        .where(*conditions)
+        .subquery("bucketed")
+    )
+    histogram = (
+        select(bucketed.c.category, bucketed.c.bucket, func.count().label("bucket_count"))
+        .group_by(bucketed.c.category, bucketed.c.bucket)
+        .cte("histogram")
+    )
+    return (
+        select(bounds, histogram.c.bucket, histogram.c.bucket_count)
+        .join(histogram, histogram.c.category == bounds.c.category)
+        .order_by(bounds.c.category, histogram.c.bucket)
+    )
+
+
+def assemble_sql_rows(rows, buckets=10) -> list:
+    """Build per-category entries from (category, bucket) rows of sql_statement()"""
+    entries = {}
+    for row in rows:
+        entry = entries.get(row.category)
+        if entry is None:
+            low, high = float(row.low), float(row.high)
+            edges = _edges(low, high, buckets)
+            entry = {
+                "category": row.category,
+                "count": row.listings,
+                "min": low,
+                "max": high,
+                "mean": float(row.mean),
+            }
+            entry.update({name: float(getattr(row, name)) for name in PERCENTILES})
+            entry["histogram"] = _histogram(edges, [0] * (len(edges) - 1))
+            entries[row.category] = entry
+        # Edges and buckets come from the same bounds row; clamping only
+        # guards against a bucket the edges cannot hold
+        histogram = entry["histogram"]
+        index = min(max(int(row.bucket), 1), len(histogram)) - 1
+        histogram[index]["count"] += int(row.bucket_count)
+    return [entries[name] for name in sorted(entries)]
+
+
+def compute_sql(db: Session, category=None, location=None, buckets=10) -> list:
+    """Aggregate in PostgreSQL with percentile_cont and width_bucket"""
+    rows = db.execute(sql_statement(category, location, buckets)).all()
+    return assemble_sql_rows(rows, buckets)
+
+
+def compute_numpy(db: Session, category=None, location=None, buckets=10) -> list:
+    """Fetch the filtered (category, price) columns once and aggregate with NumPy"""
+    rows = db.execute(
+        select(Listing.category, Listing.price).where(*_filters(category, location))
+    ).all()
+    if not rows:
+        return []
+
+    categories = np.array([row[0] for row in rows])
+    prices = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    names, group = np.unique(categories, return_inverse=True)
+    quantiles = np.array(list(PERCENTILES.values()))
+
+    results = []
+    for index, name in enumerate(names):
+        values = prices[group == index]
+        low, high = float(values.min()), float(values.max())
+        edges = _edges(low, high, buckets)
+        if low == high:
+            counts = [values.size]
+        else:
+            counts, _ = np.histogram(values, bins=buckets, range=(low, high))
+        entry = {
+            "category": str(name),
+            "count": int(values.size),
+            "min": low,
+            "max": high,
+            "mean": float(values.mean()),
+        }
+        entry.update(zip(PERCENTILES, (float(v) for v in np.quantile(values, quantiles))))
+        entry["histogram"] = _histogram(edges, counts)
+        results.append(entry)
+    return results
+
+
+def supports_sql_aggregation(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+class StatsCache:
+    """
+    Small LRU cache of computed statistics, cleared on listing writes
+
+    Attributes:
+        ttl: Seconds an entry stays valid (covers writes made by other replicas)
+        max_entries: Entries kept before the least recently used is evicted
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        """Incremented on every clear; lets callers detect a write during computation"""
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation: int = None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, *_):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+stats_cache = StatsCache(ttl=float(os.getenv("LISTING_STATS_TTL_SECONDS", "60")))
+subscribe(stats_cache.clear)
+
+
+def price_stats(db: Session, category=None, location=None, buckets=10) -> dict:
+    """Price statistics per category, served from the cache when possible"""
+    key = (category, location.lower() if location else None, buckets)
+    cached = stats_cache.get(key)
+    if cached is not None:
+        return cached
+
+    generation = stats_cache.generation
+    if supports_sql_aggregation(db):
+        source, stats = "sql", compute_sql(db, category, location, buckets)
+    else:
+        source, stats = "numpy", compute_numpy(db, category, location, buckets)
+
+    result = {
+        "category": category,
+        "location": location,
+        "buckets": buckets,
+        "source": source,
+        "stats": stats,
+    }
+    stats_cache.put(key, result, generation)
+    return result
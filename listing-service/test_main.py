@@ -4,12 +4,27 @@ Run with: pytest test_main.py -v
 """
 import pytest
 import os
+import logging
+import json
+from collections import namedtuple
+import sqlite3
+import threading
+import time
+from fastapi import FastAPI, HTTPException
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import sessionmaker
 
-from main import app
+from main import app, ensure_version_column
 from database import Base, get_db
+from models import Listing
+from stats import sql_statement, assemble_sql_rows
+from hooks import ListingChange, ListingIndex, CREATED, UPDATED, DELETED
+from slow_query import SlowQueryRecorder
+import request_logging
+from request_logging import SamplingFilter, StructuredFormatter, install_request_logging
+from metrics import ServiceMetrics, RollingWindow, TimedQueuePool, metrics as service_metrics
 
 # Use file-based SQLite for testing but delete it first
 TEST_DB = "test_listings_temp.db"
@@ -132,5 +147,431 @@ def test_negative_price():
     assert response.status_code == 422  # Validation error
 
 
+def test_update_listing():
+    """Test updating price and availability bumps the version"""
+    client.post("/listings", json={
+        "plot_id": "TEST010",
+        "title": "Editable Property",
+        "location": "Kandy",
+        "category": "Sale",
+        "price": 2000000.0,
+        "available": True
+    })
+
+    response = client.patch("/listings/TEST010", json={
+        "price": 1800000.0,
+        "available": False,
+        "version": 1
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["price"] == 1800000.0
+    assert data["available"] is False
+    assert data["version"] == 2
+    assert data["title"] == "Editable Property"
+
+
+def test_update_listing_stale_version():
+    """Test updating with an outdated version is rejected"""
+    client.post("/listings", json={
+        "plot_id": "TEST011",
+        "title": "Contended Property",
+        "location": "Galle",
+        "category": "Rent",
+        "price": 75000.0,
+        "available": True
+    })
+    assert client.patch("/listings/TEST011", json={"price": 80000.0, "version": 1}).status_code == 200
+
+    response = client.patch("/listings/TEST011", json={"price": 90000.0, "version": 1})
+    assert response.status_code == 409
+
+
+def test_update_missing_listing():
+    """Test updating a listing that doesn't exist"""
+    response = client.patch("/listings/NOPE", json={"price": 1.0, "version": 1})
+    assert response.status_code == 404
+
+
+def test_delete_listing():
+    """Test deleting a listing with and without a version check"""
+    client.post("/listings", json={
+        "plot_id": "TEST012",
+        "title": "Doomed Property",
+        "location": "Jaffna",
+        "category": "Sale",
+        "price": 500000.0,
+        "available": True
+    })
+    assert client.delete("/listings/TEST012?version=2").status_code == 409
+    assert client.delete("/listings/TEST012?version=1").status_code == 204
+    assert client.delete("/listings/TEST012").status_code == 404
+
+
+def test_ensure_version_column(tmp_path, monkeypatch):
+    """Test the version column is added to legacy tables, also by a replica losing the race"""
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE listings (plot_id VARCHAR PRIMARY KEY, title VARCHAR, "
+            "location VARCHAR, category VARCHAR, price FLOAT, available BOOLEAN)"
+        ))
+        conn.execute(text("INSERT INTO listings VALUES ('OLD001', 'Old', 'Kandy', 'Sale', 1.0, 1)"))
+
+    ensure_version_column(legacy)
+    with legacy.connect() as conn:
+        assert conn.execute(text("SELECT version FROM listings")).scalar() == 1
+
+    class StaleInspector:
+        def get_columns(self, table):
+            return []
+
+    # Another replica inspected the table before this one's ALTER committed
+    monkeypatch.setattr("main.inspect", lambda bind: StaleInspector())
+    ensure_version_column(legacy)
+    legacy.dispose()
+
+
+def test_listing_counts_follow_writes():
+    """Test write hooks keep the listing counters current"""
+    before = client.get("/listings/counts").json()
+
+    client.post("/listings", json={
+        "plot_id": "TEST013",
+        "title": "Counted Property",
+        "location": "Negombo",
+        "category": "Rent",
+        "price": 60000.0,
+        "available": True
+    })
+    client.patch("/listings/TEST013", json={"available": False, "version": 1})
+
+    after = client.get("/listings/counts").json()
+    assert after["total"] == before["total"] + 1
+    assert after["available"] == before["available"]
+    rent_before = before["by_category"].get("Rent", {}).get("unavailable", 0)
+    assert after["by_category"]["Rent"]["unavailable"] == rent_before + 1
+
+    client.delete("/listings/TEST013")
+    assert client.get("/listings/counts").json()["total"] == before["total"]
+
+
+IndexRow = namedtuple("IndexRow", "plot_id category available version")
+
+
+class WriteDuringRead:
+    """Stands in for a session whose SELECT is overtaken by a committed write"""
+
+    def __init__(self, index, change, rows):
+        self.index, self.change, self.rows = index, change, rows
+
+    def query(self, *columns):
+        return self
+
+    def all(self):
+        self.index.apply(self.change)
+        return self.rows
+
+
+def _listing_change(kind, plot_id, version, available=True):
+    return ListingChange(kind, plot_id, {
+        "category": "Sale", "location": "Galle", "price": 1.0,
+        "available": available, "version": version
+    })
+
+
+def test_listing_index_keeps_writes_during_load():
+    """Test changes published while load() reads are replayed onto the snapshot"""
+    index = ListingIndex(ttl=60)
+    # First load: the index is not loaded yet when the write is published
+    index.load(WriteDuringRead(index, _listing_change(CREATED, "RACE001", 1), rows=[]))
+    assert index.counts(None)["total"] == 1
+
+    # Re-seed: the snapshot predates a delete
+    stale = [IndexRow("RACE001", "Sale", True, 1)]
+    index.load(WriteDuringRead(index, ListingChange(DELETED, "RACE001", version=1), rows=stale))
+    assert index.counts(None)["total"] == 0
+
+
+def test_listing_index_ignores_out_of_order_changes():
+    """Test a late, older change does not overwrite newer state"""
+    index = ListingIndex(ttl=60)
+    # Snapshot already has version 3; a delayed version-2 update is replayed
+    late = _listing_change(UPDATED, "RACE002", 2, available=False)
+    index.load(WriteDuringRead(index, late, rows=[IndexRow("RACE002", "Sale", True, 3)]))
+    assert index.counts(None)["available"] == 1
+
+    index.apply(_listing_change(UPDATED, "RACE002", 4, available=False))
+    index.apply(_listing_change(UPDATED, "RACE002", 3, available=True))
+    assert index.counts(None)["available"] == 0
+
+    # A late update after the delete must not resurrect the listing
+    index.apply(ListingChange(DELETED, "RACE002", version=5))
+    index.apply(_listing_change(UPDATED, "RACE002", 5))
+    assert index.counts(None)["total"] == 0
+
+
+def test_price_stats():
+    """Test price percentiles and histogram per category"""
+    for i, price in enumerate([100.0, 200.0, 300.0, 400.0, 500.0]):
+        client.post("/listings", json={
+            "plot_id": f"STAT{i}",
+            "title": "Stats Property",
+            "location": "Statsville North",
+            "category": "Sale",
+            "price": price,
+            "available": True
+        })
+    client.post("/listings", json={
+        "plot_id": "STAT9",
+        "title": "Stats Rental",
+        "location": "Statsville South",
+        "category": "Rent",
+        "price": 50.0,
+        "available": True
+    })
+
+    response = client.get("/listings/stats?location=statsville&buckets=4")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["source"] == "numpy"
+    by_category = {entry["category"]: entry for entry in data["stats"]}
+
+    sale = by_category["Sale"]
+    assert sale["count"] == 5
+    assert sale["median"] == 300.0
+    assert sale["p25"] == 200.0
+    assert sale["mean"] == 300.0
+    assert [bucket["count"] for bucket in sale["histogram"]] == [1, 1, 1, 2]
+    assert sale["histogram"][0]["lower"] == 100.0
+    assert sale["histogram"][-1]["upper"] == 500.0
+
+    rent = by_category["Rent"]
+    assert rent["count"] == 1
+    assert rent["histogram"] == [{"lower": 50.0, "upper": 50.0, "count": 1}]
+
+
+def test_price_stats_cache_invalidated_on_write():
+    """Test cached stats are refreshed after a listing changes"""
+    client.post("/listings", json={
+        "plot_id": "CACHE1",
+        "title": "Cached Property",
+        "location": "Cachetown",
+        "category": "Sale",
+        "price": 1000.0,
+        "available": True
+    })
+    first = client.get("/listings/stats?location=Cachetown").json()
+    assert first["stats"][0]["max"] == 1000.0
+
+    client.patch("/listings/CACHE1", json={"price": 2000.0, "version": 1})
+    second = client.get("/listings/stats?location=Cachetown").json()
+    assert second["stats"][0]["max"] == 2000.0
+
+
+StatsRow = namedtuple(
+    "StatsRow", "category listings low high mean p25 median p75 p90 bucket bucket_count"
+)
+
+
+def test_price_stats_sql_statement_compiles_for_postgresql():
+    """Test summary and histogram are one statement over one bounds CTE"""
+    sql = str(sql_statement("Sale", "Colombo", 4).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("WITH bounds AS")
+    assert sql.count("FROM listings") == 2
+    assert "percentile_cont" in sql and "width_bucket" in sql
+
+
+def test_price_stats_assemble_sql_rows():
+    """Test PostgreSQL rows become the same entries as the NumPy path"""
+    rows = [
+        StatsRow("Sale", 3, 100.0, 300.0, 200.0, 150.0, 200.0, 250.0, 280.0, 1, 1),
+        StatsRow("Sale", 3, 100.0, 300.0, 200.0, 150.0, 200.0, 250.0, 280.0, 2, 2),
+        # min == max: a single bucket
+        StatsRow("Rent", 2, 50.0, 50.0, 50.0, 50.0, 50.0, 50.0, 50.0, 1, 2),
+    ]
+    stats = assemble_sql_rows(rows, buckets=2)
+    assert [entry["category"] for entry in stats] == ["Rent", "Sale"]
+    rent, sale = stats
+    assert rent["histogram"] == [{"lower": 50.0, "upper": 50.0, "count": 2}]
+    assert [b["count"] for b in sale["histogram"]] == [1, 2]
+    assert sale["histogram"][1]["upper"] == 300.0
+    assert sale["median"] == 200.0
+
+
+def test_price_stats_assemble_sql_rows_bucket_mismatch():
+    """Test a bucket outside the edges is clamped instead of raising"""
+    rows = [StatsRow("Rent", 2, 50.0, 50.0, 50.0, 50.0, 50.0, 50.0, 50.0, 3, 2)]
+    entry = assemble_sql_rows(rows, buckets=3)[0]
+    assert entry["histogram"] == [{"lower": 50.0, "upper": 50.0, "count": 2}]
+
+
+def test_price_stats_invalid_category():
+    """Test stats reject unknown categories"""
+    response = client.get("/listings/stats?category=Lease")
+    assert response.status_code == 422
+
+
+def test_metrics_endpoint():
+    """Test autoscaling signals are exposed in Prometheus format"""
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    for name in (
+        "http_requests_in_flight",
+        "http_request_latency_slo_attainment",
+        "db_pool_wait_seconds_avg",
+    ):
+        assert f"# TYPE {name} gauge" in body
+
+
+def test_latency_slo_attainment():
+    """Test the rolling SLO ratio and average concurrency"""
+    tracker = ServiceMetrics(slo_ms=100, window=60)
+    for duration in (0.05, 0.05, 0.05, 0.5):
+        tracker.request_started()
+        tracker.request_finished(duration)
+    snapshot = tracker.snapshot()
+    assert snapshot["http_requests_in_flight"] == 0
+    assert snapshot["http_requests_window_total"] == 4
+    assert snapshot["http_request_latency_slo_attainment"] == 0.75
+    assert snapshot["http_requests_in_flight_avg"] > 0
+
+
+def test_pool_wait_excludes_connect_time(monkeypatch):
+    """Test only time blocked on the pool counts as a wait, once per checkout"""
+    waits = RollingWindow(60)
+    monkeypatch.setattr(service_metrics, "pool_waits", waits)
+
+    def slow_connect():
+        time.sleep(0.05)
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    pool = TimedQueuePool(slow_connect, pool_size=1, max_overflow=0, timeout=5)
+    first = pool.connect()
+    count, _, total, _ = waits.totals()
+    assert count == 1
+    assert total < 0.02
+
+    threading.Timer(0.1, first.close).start()
+    second = pool.connect()
+    count, _, _, peak = waits.totals()
+    assert count == 2
+    assert peak >= 0.08
+    second.close()
+    pool.dispose()
+
+
+class RecordingHandler(logging.Handler):
+    """Collects records that pass the sampling filter"""
+
+    def __init__(self):
+        super().__init__()
+        self.addFilter(SamplingFilter())
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _sampling_app():
+    sampled_app = FastAPI()
+    install_request_logging(sampled_app)
+    app_logger = logging.getLogger("sampling-test")
+
+    @sampled_app.get("/work")
+    def work():
+        app_logger.info("routine detail")
+        app_logger.warning("something odd")
+        return {"ok": True}
+
+    @sampled_app.get("/slow")
+    def slow():
+        time.sleep(0.06)
+        return {"ok": True}
+
+    @sampled_app.get("/fail")
+    def fail():
+        raise HTTPException(status_code=503, detail="down")
+
+    return sampled_app
+
+
+def test_unsampled_request_keeps_only_warnings(monkeypatch):
+    """Test an unsampled request drops INFO but keeps WARNING, slow and failed requests"""
+    monkeypatch.setattr(request_logging, "LOG_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(request_logging, "LOG_SLOW_REQUEST_MS", 50)
+    handler = RecordingHandler()
+    logging.getLogger().addHandler(handler)
+    try:
+        sampled_client = TestClient(_sampling_app())
+        sampled_client.get("/work")
+        sampled_client.get("/slow")
+        sampled_client.get("/fail")
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+    messages = [(r.levelname, r.getMessage()) for r in handler.records]
+    assert ("WARNING", "something odd") in messages
+    assert not any(message == "routine detail" for _, message in messages)
+    assert ("WARNING", "GET /slow 200") in messages
+    assert ("WARNING", "GET /fail 503") in messages
+    assert not any(message == "GET /work 200" for _, message in messages)
+
+
+def test_sampled_request_keeps_info(monkeypatch):
+    """Test a sampled request keeps its INFO records and access line"""
+    monkeypatch.setattr(request_logging, "LOG_SAMPLE_RATE", 1.0)
+    handler = RecordingHandler()
+    logging.getLogger().addHandler(handler)
+    try:
+        TestClient(_sampling_app()).get("/work")
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+    messages = [r.getMessage() for r in handler.records]
+    assert "routine detail" in messages
+    assert "GET /work 200" in messages
+
+
+def test_structured_formatter_includes_extra_fields():
+    """Test records render as one JSON object including `extra` fields"""
+    record = logging.getLogger("access").makeRecord(
+        "access", logging.INFO, __file__, 1, "%s %s", ("GET", "/health"), None,
+        extra={"status": 200, "duration_ms": 1.5}
+    )
+    entry = json.loads(StructuredFormatter("test-service").format(record))
+    assert entry["msg"] == "GET /health"
+    assert entry["service"] == "test-service"
+    assert entry["level"] == "INFO"
+    assert entry["status"] == 200
+    assert entry["duration_ms"] == 1.5
+
+
+def test_slow_query_recorder():
+    """Test slow statements are captured with parameter shapes and a plan"""
+    recorder = SlowQueryRecorder(threshold_ms=0)
+    recorder.attach(engine)
+    try:
+        db = TestingSessionLocal()
+        db.query(Listing).filter(Listing.plot_id == "TEST001").first()
+        db.close()
+    finally:
+        recorder.detach(engine)
+
+    entry = recorder.entries()[0]
+    assert "FROM listings" in entry["statement"]
+    assert "TEST001" not in str(entry["parameters"])
+    assert entry["plan"]
+
+
+def test_slow_query_endpoint():
+    """Test the admin slow-query endpoint"""
+    response = client.get("/admin/slow-queries")
+    assert response.status_code == 200
+    assert isinstance(response.json()["queries"], list)
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
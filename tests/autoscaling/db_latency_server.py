@@ -0,0 +1,90 @@
+"""
+Run a service with simulated PostgreSQL latency (used by load_test.py)
+
+Serves listing-service or inquiry-service from a temporary SQLite file and
+makes every SQL statement wait for one of `--db-capacity` database slots
+and then sleep `--db-latency-ms`. This models a saturated PostgreSQL: once
+the slots are busy, statements queue, request latency climbs and pool
+waits appear, while the service itself burns very little CPU.
+
+Usage:
+    python db_latency_server.py listing-service --port 8100
+    python db_latency_server.py inquiry-service --port 8101 --db-latency-ms 50 --db-capacity 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(service: str, session_factory):
+    """Insert a few rows so reads return realistic payloads"""
+    db = session_factory()
+    try:
+        if service == "listing-service":
+            from models import Listing
+            for i in range(50):
+                db.add(Listing(
+                    plot_id=f"LOAD{i:03d}",
+                    title=f"Load Test Property {i}",
+                    location="Colombo 07",
+                    category="Sale" if i % 2 else "Rent",
+                    price=1000000.0 + i * 10000,
+                    available=True
+                ))
+        else:
+            from models import Inquiry
+            for i in range(200):
+                db.add(Inquiry(
+                    plot_id=f"LOAD{i % 10:03d}",
+                    name="Load Tester",
+                    email="load@example.com",
+                    phone="+94770000000",
+                    message=f"Load test inquiry {i}"
+                ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service with simulated DB latency")
+    parser.add_argument("service", choices=["listing-service", "inquiry-service"])
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--db-latency-ms", type=float, default=250.0)
+    parser.add_argument("--db-capacity", type=int, default=2)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="autoscaling-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ.setdefault("LOG_SAMPLE_RATE", "0.1")
+    os.environ.setdefault("METRICS_WINDOW_SECONDS", "10")
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.join(REPO_ROOT, args.service))
+
+    import uvicorn
+    from sqlalchemy import event
+    import database
+    import main as service
+
+    # Schema setup normally runs in the app's startup handler, after seeding
+    database.Base.metadata.create_all(bind=database.engine)
+    seed(args.service, database.SessionLocal)
+
+    slots = threading.BoundedSemaphore(args.db_capacity)
+    latency = args.db_latency_ms / 1000
+
+    @event.listens_for(database.engine, "before_cursor_execute")
+    def simulate_db_latency(conn, cursor, statement, parameters, context, executemany):
+        with slots:
+            time.sleep(latency)
+
+    uvicorn.run(service.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
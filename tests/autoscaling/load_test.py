@@ -0,0 +1,204 @@
+"""
+Autoscaling load-test scenario: custom metrics vs CPU-only HPA
+
+Starts a service with simulated PostgreSQL latency (db_latency_server.py),
+ramps concurrent clients in stages and samples GET /metrics every
+`--interval` seconds. Each sample is fed through the HPA algorithm,
+desired = ceil(replicas * value / target) with the default 10% tolerance,
+for two policies, treating the local process as one pod:
+
+- CPU only, as in k8s/03-listing-service.yaml (70% of a 100m request)
+- the custom metrics in k8s/autoscaling/*-hpa.yaml
+
+and reports when each policy would first ask for more replicas.
+
+Usage:
+    python tests/autoscaling/load_test.py
+    python tests/autoscaling/load_test.py --service inquiry-service --stages 1 4 8 16
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Mirrors k8s/03-listing-service.yaml and k8s/04-inquiry-service.yaml
+CPU_REQUEST_CORES = 0.1
+CPU_TARGET_UTILIZATION = 0.70
+
+# Mirrors k8s/autoscaling/*-hpa.yaml
+CUSTOM_TARGETS = {
+    "http_requests_in_flight_avg": 4.0,
+    "http_request_latency_slo_violation_ratio": 0.05,
+    "db_pool_wait_seconds_avg": 0.020,
+}
+
+HPA_TOLERANCE = 0.1
+
+READ_PATHS = {
+    "listing-service": "/listings?limit=20",
+    "inquiry-service": "/inquiries?plot_id=LOAD001&limit=20",
+}
+
+
+def desired_replicas(value: float, target: float, replicas: int = 1) -> int:
+    ratio = value / target
+    if abs(ratio - 1.0) <= HPA_TOLERANCE:
+        return replicas
+    return max(1, math.ceil(replicas * ratio))
+
+
+def scrape(base_url: str) -> dict:
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=5) as response:
+        body = response.read().decode()
+    values = {}
+    for line in body.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.split()
+            values[name] = float(value)
+    return values
+
+
+def wait_until_healthy(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Service at {base_url} did not become healthy")
+
+
+class LoadGenerator:
+    """Closed-loop clients: each repeatedly issues a read and waits for the answer"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.clients = 0
+        self.completed = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def _client(self, stage_stop: threading.Event):
+        while not stage_stop.is_set() and not self._stop.is_set():
+            try:
+                with urllib.request.urlopen(self.url, timeout=30) as response:
+                    response.read()
+                with self._lock:
+                    self.completed += 1
+            except OSError:
+                with self._lock:
+                    self.errors += 1
+
+    def run_stage(self, pool: ThreadPoolExecutor, clients: int, seconds: float):
+        stage_stop = threading.Event()
+        self.clients = clients
+        futures = [pool.submit(self._client, stage_stop) for _ in range(clients)]
+        time.sleep(seconds)
+        stage_stop.set()
+        for future in futures:
+            future.result()
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custom-metric vs CPU-only HPA load test")
+    parser.add_argument("--service", choices=sorted(READ_PATHS), default="listing-service")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--stages", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--stage-seconds", type=float, default=20.0)
+    parser.add_argument("--interval", type=float, default=5.0)
+    parser.add_argument("--db-latency-ms", type=float, default=250.0)
+    parser.add_argument("--db-capacity", type=int, default=2)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "db_latency_server.py"), args.service,
+        "--port", str(args.port),
+        "--db-latency-ms", str(args.db_latency_ms),
+        "--db-capacity", str(args.db_capacity),
+    ])
+    samples = []
+    try:
+        wait_until_healthy(base_url)
+        load = LoadGenerator(base_url + READ_PATHS[args.service])
+        started = time.monotonic()
+        done = threading.Event()
+
+        def sampler():
+            previous = scrape(base_url)
+            previous_at = time.monotonic()
+            previous_completed = 0
+            while not done.wait(args.interval):
+                current = scrape(base_url)
+                now = time.monotonic()
+                elapsed = now - previous_at
+                cpu = (current["process_cpu_seconds_total"]
+                       - previous["process_cpu_seconds_total"]) / elapsed / CPU_REQUEST_CORES
+                custom = {name: current[name] for name in CUSTOM_TARGETS}
+                samples.append({
+                    "t": now - started,
+                    "clients": load.clients,
+                    "rps": (load.completed - previous_completed) / elapsed,
+                    "cpu": cpu,
+                    "cpu_desired": desired_replicas(cpu, CPU_TARGET_UTILIZATION),
+                    "custom_desired": max(
+                        desired_replicas(value, CUSTOM_TARGETS[name]) for name, value in custom.items()
+                    ),
+                    **custom,
+                })
+                previous, previous_at, previous_completed = current, now, load.completed
+
+        sampling = threading.Thread(target=sampler, daemon=True)
+        sampling.start()
+        with ThreadPoolExecutor(max_workers=max(args.stages)) as pool:
+            for clients in args.stages:
+                load.run_stage(pool, clients, args.stage_seconds)
+        done.set()
+        sampling.join()
+        load.stop()
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'t(s)':>6} {'clients':>7} {'rps':>7} {'cpu%':>6} {'inflight':>8} "
+          f"{'slo_viol':>8} {'pool_ms':>8} {'cpu->':>5} {'custom->':>8}")
+    for s in samples:
+        print(f"{s['t']:>6.0f} {s['clients']:>7} {s['rps']:>7.1f} {s['cpu'] * 100:>6.0f} "
+              f"{s['http_requests_in_flight_avg']:>8.2f} "
+              f"{s['http_request_latency_slo_violation_ratio']:>8.2f} "
+              f"{s['db_pool_wait_seconds_avg'] * 1000:>8.1f} "
+              f"{s['cpu_desired']:>5} {s['custom_desired']:>8}")
+
+    def first_scale_up(key):
+        return next((s for s in samples if s[key] > 1), None)
+
+    total_rps = sum(s["rps"] for s in samples)
+    if total_rps:
+        cpu_ms = sum(s["cpu"] * CPU_REQUEST_CORES for s in samples) / total_rps * 1000
+        print(f"\nCPU per request: {cpu_ms:.1f}ms "
+              f"(CPU-only HPA needs > {CPU_TARGET_UTILIZATION * CPU_REQUEST_CORES / cpu_ms * 1000:.0f} req/s per pod)")
+
+    print()
+    for label, key in (("CPU-only HPA", "cpu_desired"), ("Custom-metric HPA", "custom_desired")):
+        sample = first_scale_up(key)
+        if sample:
+            print(f"{label:<18} first scales up at t={sample['t']:.0f}s "
+                  f"({sample['clients']} clients, {sample['rps']:.1f} req/s)")
+        else:
+            print(f"{label:<18} never scales up")
+
+
+if __name__ == "__main__":
+    main()